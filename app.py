@@ -15,19 +15,67 @@ Streamlit: 查找同时持有两个 Solana 代币的钱包地址
 
 import math
 import time
+import json
+import hashlib
+import heapq
+import threading
+import random
+import asyncio
+import httpx
+import orjson
+import msgspec
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import streamlit as st
-from typing import Dict, Tuple, List
+from typing import Any, Callable, Deque, Dict, Tuple, List, Optional, Union
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from decimal import Decimal, ROUND_CEILING
 
 # ------------------------- 配置 -------------------------
 
+# 持有者列表：owner 为索引的 UI 余额 Series；只需地址（need_balances=False）时为 owner Index。
+# owner 以 Arrow 字符串（string[pyarrow]）连续存储，百万级地址时比 Python str 对象省约 3 倍内存
+Holders = Union[pd.Series, pd.Index]
+
 HELIUS_BASE = "https://mainnet.helius-rpc.com/?api-key={api_key}"
 SOLSCAN_HOLDERS = "https://pro-api.solscan.io/v1.0/token/holders"
 SOLSCAN_TOKEN_META = "https://pro-api.solscan.io/v2.0/token/meta"
 HELIUS_GET_TOKEN_ACCOUNTS = "https://mainnet.helius-rpc.com/?api-key={api_key}"
 HELIUS_GET_TOKEN_SUPPLY = "https://mainnet.helius-rpc.com/?api-key={api_key}"
 
+# 重试：429/5xx 视为可重试，退避上限（秒）
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+MAX_BACKOFF = 30.0
+
+# 主动限速：每分钟请求数（默认值，会根据响应中的限速头调整），剩余额度低于阈值即暂停
+HELIUS_RPM = 600
+SOLSCAN_RPM = 600
+RATE_LIMIT_MIN_REMAINING = 2
+
+# 缓存：decimals 不可变缓存 1 天；持有者列表缓存 10 分钟（内存 + 磁盘）
+DECIMALS_TTL = 24 * 3600
+HOLDERS_TTL = 600
+CACHE_DIR = Path.home() / ".cache" / "solana_xquery"
+# Solscan 分页的条件请求缓存（ETag / Last-Modified + 响应字节）最多保留的页数
+ETAG_CACHE_MAX = 4096
+
+# Helius：每次 POST 批量请求的页数（JSON-RPC batch）
+HELIUS_BATCH_PAGES = 10
+
+# 分页并发（AIMD）：初始/最小/最大在途请求数，目标平均延迟（秒）
+AIMD_START = 4
+AIMD_MIN = 1
+AIMD_MAX = 32
+AIMD_LATENCY_TARGET = 1.0
+
 # ------------------------- 工具函数 -------------------------
 
 def get_secret(key: str, fallback: str = "") -> str:
@@ -36,31 +84,557 @@ def get_secret(key: str, fallback: str = "") -> str:
     except Exception:
         return fallback
 
-def ui_amount(amount_int: int, decimals: int) -> float:
-    return float(amount_int) / (10 ** decimals)
+@st.cache_resource
+def http_session() -> requests.Session:
+    """全局复用的 requests 会话：保持长连接，避免每次请求都重新握手 TCP+TLS；Streamlit 重跑时也复用"""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=50, pool_maxsize=100, max_retries=0))
+    session.headers["Connection"] = "keep-alive"
+    session.headers["Accept-Encoding"] = "gzip"
+    return session
+
+def arrow_owners(values) -> pd.Index:
+    """owner 序列 -> string[pyarrow] Index（Arrow 连续内存，不为每个地址单独分配 Python 对象）"""
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return pd.Index(pd.arrays.ArrowStringArray(values.cast(pa.large_string())))
+    return pd.Index(values).astype("string[pyarrow]")
+
+def owner_index(holders) -> pd.Index:
+    """持有者（Series / Index / 任意 owner 序列）-> owner Index"""
+    if isinstance(holders, pd.Index):
+        return holders
+    if isinstance(holders, pd.Series):
+        return holders.index
+    return pd.Index(list(holders))
+
+def owner_array(holders) -> pa.Array:
+    """持有者 -> Arrow large_string 数组，供 pyarrow.compute 向量化求交集"""
+    return pa.array(owner_index(holders), type=pa.large_string())
+
+def holders_to_table(holders: Holders) -> pa.Table:
+    if isinstance(holders, pd.Index):
+        return pa.table({"owner": owner_array(holders)})
+    return pa.table({"owner": owner_array(holders), "bal": pa.array(holders.to_numpy(dtype="float64"))})
+
+def holders_from_table(table: pa.Table) -> Holders:
+    owners = arrow_owners(table.column("owner"))
+    if "bal" not in table.column_names:
+        return owners
+    return pd.Series(table.column("bal").to_numpy(), index=owners, name="bal")
+
+def disk_cache_paths(provider: str, mint: str, need_balances: bool = True) -> Tuple[Path, Path]:
+    """每个 数据源 + mint + 模式 一份快照：(parquet, meta.json)"""
+    key = hashlib.sha1(f"{provider}:{mint}:{'balances' if need_balances else 'owners'}".encode()).hexdigest()
+    return CACHE_DIR / f"{key}.parquet", CACHE_DIR / f"{key}.meta.json"
+
+def load_disk_cache(provider: str, mint: str, min_amount_ui: float, need_balances: bool = True) -> Optional[Holders]:
+    """
+    读取磁盘快照（未超过 HOLDERS_TTL）：阈值相同时直接命中；
+    Solscan 的余额已是 owner 层级，快照阈值更低时可按余额再过滤得到
+    （Helius 阈值作用于单个 token account，不能这样复用）。
+    只需地址时也可由带余额的快照得到。
+    """
+    modes = [need_balances] if need_balances else [False, True]
+    for balances in modes:
+        parquet_path, meta_path = disk_cache_paths(provider, mint, balances)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            continue
+        if time.time() - meta.get("ts", 0) > HOLDERS_TTL:
+            continue
+        cached_min = meta.get("min_amount_ui")
+        refilter = balances and provider == "solscan" and cached_min is not None and cached_min < min_amount_ui
+        if cached_min != min_amount_ui and not refilter:
+            continue
+        try:
+            holders = holders_from_table(pq.read_table(parquet_path))
+        except Exception:
+            continue
+        if refilter:
+            holders = holders[holders >= min_amount_ui]
+        return holders if need_balances else owner_index(holders)
+    return None
+
+def save_disk_cache(provider: str, mint: str, min_amount_ui: float, holders: Holders):
+    """保存为 parquet（zstd）+ meta.json；meta 最后写入，有 meta 即表示快照完整"""
+    parquet_path, meta_path = disk_cache_paths(provider, mint, isinstance(holders, pd.Series))
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        meta_path.unlink(missing_ok=True)
+        pq.write_table(holders_to_table(holders), parquet_path, compression="zstd")
+        meta_path.write_text(json.dumps({"ts": time.time(), "provider": provider, "mint": mint, "min_amount_ui": min_amount_ui}))
+    except Exception:
+        # 缓存写入失败不影响查询结果
+        pass
+
+def clear_disk_cache():
+    for p in CACHE_DIR.glob("*"):
+        if p.is_file():
+            p.unlink(missing_ok=True)
+
+@st.cache_data(ttl=HOLDERS_TTL, max_entries=64, show_spinner=False)
+def memo_holders(provider: str, mint: str, min_amount_ui: float, need_balances: bool, _holders: Optional[Holders] = None) -> Holders:
+    """
+    持有者列表的内存缓存层（st.cache_data，键为 数据源 + mint + 阈值 + 模式），
+    供带回调、不能直接缓存的并发拉取使用；_holders 不计入缓存键：
+    未命中时传入结果即写入，未命中且未传入时抛 KeyError（异常不会被缓存）。
+    """
+    if _holders is None:
+        raise KeyError(mint)
+    return _holders
+
+def cached_holders(provider: str, mint: str, min_amount_ui: float, need_balances: bool = True) -> Optional[Holders]:
+    """先查内存缓存，再查磁盘快照（命中后写回内存缓存）"""
+    try:
+        return memo_holders(provider, mint, min_amount_ui, need_balances)
+    except KeyError:
+        pass
+    holders = load_disk_cache(provider, mint, min_amount_ui, need_balances)
+    if holders is not None:
+        memo_holders(provider, mint, min_amount_ui, need_balances, _holders=holders)
+    return holders
+
+def min_raw_amount(min_amount_ui: float, decimals: int) -> int:
+    """UI 阈值 -> 原始整数单位（向上取整，避免浮点误差放过低于阈值的账户）"""
+    raw = Decimal(str(min_amount_ui or 0.0)) * (10 ** decimals)
+    return int(raw.to_integral_value(rounding=ROUND_CEILING))
+
+class RecoverableError(Exception):
+    """可重试的错误：429 / 5xx / 连接错误 / 超时"""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UnrecoverableError(Exception):
+    """不可重试的错误：429 以外的 4xx 等；status 为 HTTP 状态码"""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 头：秒数或 HTTP-date，限制在 [0, MAX_BACKOFF] 秒内（避免长时间阻塞脚本线程），
+    解析失败返回 None
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(MAX_BACKOFF, max(0.0, seconds))
+
+def backoff_delay(attempt: int, backoff: float, retry_after: Optional[float] = None) -> float:
+    """优先使用服务端给的 Retry-After，否则指数退避 + 抖动；两者都不超过 MAX_BACKOFF 秒"""
+    if retry_after is not None:
+        return min(MAX_BACKOFF, max(0.0, retry_after))
+    return min(MAX_BACKOFF, backoff * (2 ** attempt) * (1 + random.random() * 0.5))
+
+def raise_for_status(status: int, headers, text: str):
+    """把非 200 响应分类为可重试 / 不可重试异常"""
+    msg = f"{status} {text[:200]}"
+    if status == 429:
+        raise RecoverableError(msg, retry_after=parse_retry_after(headers.get("Retry-After")))
+    if status in RETRYABLE_STATUS:
+        raise RecoverableError(msg)
+    raise UnrecoverableError(msg, status=status)
+
+def header_number(headers, *names: str) -> Optional[float]:
+    """按顺序读取第一个存在且可解析为数字的响应头"""
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(str(value).rstrip("s"))
+        except ValueError:
+            continue
+    return None
+
+class RateLimiter:
+    """
+    滑动窗口 RPM 计数器：请求前主动等待，而不是等到 429 才退避。
+    observe() 读取响应中的限速头，剩余额度不足或带 Retry-After 时暂停到窗口重置。
+    实例经 st.cache_resource 被所有会话线程共享，状态读写都在 lock 内
+    （lock 只在计算时持有，不跨 sleep / await）。
+    """
+
+    def __init__(self, rpm: int, window: float = 60.0, min_remaining: int = RATE_LIMIT_MIN_REMAINING):
+        self.rpm = rpm
+        self.window = window
+        self.min_remaining = min_remaining
+        self.stamps: Deque[float] = deque()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
 
-def retry_fetch_json(method: str, url: str, headers=None, params=None, json_body=None, max_retries=5, backoff=0.8):
-    """简单重试机制，返回 (ok, json或错误文本)"""
+    def _reserve(self) -> float:
+        """需要等待的秒数；无需等待时在同一临界区内记下本次请求，避免多个线程同时通过检查"""
+        with self.lock:
+            now = time.monotonic()
+            while self.stamps and now - self.stamps[0] >= self.window:
+                self.stamps.popleft()
+            delay = self.blocked_until - now
+            if len(self.stamps) >= self.rpm:
+                delay = max(delay, self.stamps[0] + self.window - now)
+            if delay <= 0:
+                self.stamps.append(now)
+            return max(0.0, delay)
+
+    def wait_if_throttled(self):
+        while (delay := self._reserve()) > 0:
+            time.sleep(delay)
+
+    async def wait_if_throttled_async(self):
+        while (delay := self._reserve()) > 0:
+            await asyncio.sleep(delay)
+
+    def observe(self, headers):
+        pause = parse_retry_after(headers.get("Retry-After"))
+        remaining = header_number(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining", "ratelimit-remaining")
+        reset = None
+        if pause is None and remaining is not None and remaining <= self.min_remaining:
+            reset = header_number(headers, "x-ratelimit-reset-requests", "x-ratelimit-reset", "ratelimit-reset")
+            if reset is not None and reset > 1e9:
+                # 部分服务返回 epoch 秒
+                reset = reset - time.time()
+        with self.lock:
+            now = time.monotonic()
+            if pause is None and remaining is not None and remaining <= self.min_remaining:
+                if reset is None:
+                    reset = (self.stamps[0] + self.window - now) if self.stamps else self.window
+                pause = max(0.0, reset)
+            if pause:
+                self.blocked_until = max(self.blocked_until, now + pause)
+
+@st.cache_resource
+def rate_limiter(provider: str) -> RateLimiter:
+    """每个数据源一个限速器，Streamlit 重跑与多会话间共享"""
+    return RateLimiter(HELIUS_RPM if provider == "helius" else SOLSCAN_RPM)
+
+def retry_fetch_json(method: str, url: str, headers=None, params=None, json_body=None, max_retries=5, backoff=0.8,
+                     limiter: Optional[RateLimiter] = None):
+    """重试机制（指数退避 + 抖动，遵循 Retry-After），返回 (ok, json或错误文本)"""
+    last = ""
     for i in range(max_retries):
         try:
-            if method == "GET":
-                r = requests.get(url, headers=headers, params=params, timeout=30)
+            if limiter:
+                limiter.wait_if_throttled()
+            try:
+                if method == "GET":
+                    r = http_session().get(url, headers=headers, params=params, timeout=30)
+                else:
+                    r = http_session().post(url, headers=headers, json=json_body, timeout=60)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise RecoverableError(str(e))
+            if limiter:
+                limiter.observe(r.headers)
+            if r.status_code == 200:
+                return True, orjson.loads(r.content)
+            raise_for_status(r.status_code, r.headers, r.text)
+        except RecoverableError as e:
+            last = str(e)
+            if i < max_retries - 1:
+                time.sleep(backoff_delay(i, backoff, e.retry_after))
+        except (UnrecoverableError, ValueError) as e:
+            return False, str(e)
+    return False, last
+
+def http_client(max_connections: int = 64) -> httpx.AsyncClient:
+    """分页抓取用的 httpx 异步客户端（HTTP/2 + 连接池）"""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=32),
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+@asynccontextmanager
+async def client_scope(client: Optional[httpx.AsyncClient] = None, max_connections: int = 64):
+    """传入 client 时直接复用（由调用方负责关闭），否则新建一个并在结束时关闭"""
+    if client is not None:
+        yield client
+        return
+    async with http_client(max_connections) as new_client:
+        yield new_client
+
+class AIMDController:
+    """
+    AIMD 并发控制：最近 window 页平均延迟不超过 latency_target 时并发 +0.5，
+    遇到 429/5xx/超时并发减半（同一批在途请求只减一次）；
+    连续失败 breaker_threshold 次则熔断 cooldown 秒，期间不发新请求（在途请求的重试也等待熔断恢复）。
+    """
+
+    def __init__(self, start: float = AIMD_START, c_min: float = AIMD_MIN, c_max: float = AIMD_MAX,
+                 latency_target: float = AIMD_LATENCY_TARGET, window: int = 16,
+                 breaker_threshold: int = 5, cooldown: float = 10.0):
+        self.limit = float(start)
+        self.c_min = float(c_min)
+        self.c_max = float(c_max)
+        self.latency_target = latency_target
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.breaker_threshold = breaker_threshold
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_decrease = 0.0
+        self.cond = asyncio.Condition()
+
+    async def wait_breaker(self):
+        """熔断期间等待恢复"""
+        while (wait := self.open_until - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+
+    async def acquire(self):
+        """等待空闲并发槽位（及熔断恢复）"""
+        await self.wait_breaker()
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < max(1, int(self.limit)))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    async def record(self, started: float, failed: bool = False):
+        """记录一次请求的结果（started 为发出时间），据此调整并发上限"""
+        now = time.monotonic()
+        async with self.cond:
+            if failed:
+                self.failures += 1
+                self.latencies.clear()
+                # 在上次减半之前发出的请求失败不再重复减半
+                if started >= self.last_decrease:
+                    self.limit = max(self.c_min, self.limit * 0.5)
+                    self.last_decrease = now
+                if self.failures >= self.breaker_threshold:
+                    self.open_until = now + self.cooldown
+                    self.failures = 0
             else:
-                r = requests.post(url, headers=headers, json=json_body, timeout=60)
+                self.failures = 0
+                self.latencies.append(now - started)
+                if sum(self.latencies) / len(self.latencies) <= self.latency_target:
+                    self.limit = min(self.c_max, self.limit + 0.5)
+            self.cond.notify_all()
+
+@st.cache_resource
+def etag_cache() -> Dict[tuple, Tuple[str, str, bytes]]:
+    """进程内条件请求缓存：请求键 -> (ETag, Last-Modified, 响应字节)，Streamlit 重跑与多会话间共享"""
+    return {}
+
+@st.cache_resource
+def etag_lock() -> threading.Lock:
+    """etag_cache 的写入 / 淘汰 / 清空锁；与缓存一样经 st.cache_resource 共享（模块级的锁每次重跑都会重建）"""
+    return threading.Lock()
+
+def conditional_headers(headers, cached: Optional[Tuple[str, str, bytes]]):
+    """有缓存时带上 If-None-Match / If-Modified-Since，未变化的页服务端返回 304 且不再传输响应体"""
+    if not cached:
+        return headers
+    etag, last_modified, _ = cached
+    headers = dict(headers or {})
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def store_etag(key: tuple, r: httpx.Response):
+    """记录 200 响应的校验器与响应字节；响应不带 ETag / Last-Modified 时不缓存"""
+    etag, last_modified = r.headers.get("ETag", ""), r.headers.get("Last-Modified", "")
+    if not (etag or last_modified):
+        return
+    cache = etag_cache()
+    with etag_lock():
+        cache.pop(key, None)
+        cache[key] = (etag, last_modified, r.content)
+        # dict 保持插入顺序：超出上限时淘汰最早写入的页
+        while len(cache) > ETAG_CACHE_MAX:
+            cache.pop(next(iter(cache)))
+
+async def _fetch_page(client: httpx.AsyncClient, method: str, url: str, headers=None, params=None, json_body=None,
+                      max_retries=5, backoff=0.8, limiter: Optional[RateLimiter] = None, controller: Optional[AIMDController] = None,
+                      decode: Callable[[bytes], object] = orjson.loads, etag_key: Optional[tuple] = None):
+    """
+    retry_fetch_json 的异步版本，用于并发分页，返回 (ok, json或错误)，
+    不可重试的 HTTP 错误返回 UnrecoverableError（带状态码），其余为错误文本；
+    decode 用于直接把响应字节解码为 msgspec.Struct。
+    etag_key 非空时发送条件请求（仅用于 GET），304 时复用 etag_cache 中该页的响应字节。
+    """
+    last = ""
+    for i in range(max_retries):
+        # None：不计入 AIMD（如 4xx）；True/False：本次请求失败/成功
+        failed = None
+        retry_after = None
+        try:
+            if controller:
+                # 每次尝试（包括重试）前检查熔断，熔断期间在途请求也不再重试
+                await controller.wait_breaker()
+            if limiter:
+                await limiter.wait_if_throttled_async()
+            started = time.monotonic()
+            cached = etag_cache().get(etag_key) if etag_key is not None else None
+            try:
+                if method == "GET":
+                    r = await client.get(url, headers=conditional_headers(headers, cached), params=params, timeout=30)
+                else:
+                    r = await client.post(url, headers=headers, json=json_body, timeout=60)
+            except httpx.TransportError as e:
+                raise RecoverableError(str(e) or type(e).__name__)
+            if limiter:
+                limiter.observe(r.headers)
+            # 解码成功后才计为成功：200 但响应体损坏时不应提高并发
             if r.status_code == 200:
-                return True, r.json()
-            # 429/5xx 退避
-            if r.status_code in (429, 500, 502, 503, 504):
-                time.sleep(backoff * (i + 1))
-                continue
-            return False, f"{r.status_code} {r.text[:200]}"
-        except Exception as e:
-            time.sleep(backoff * (i + 1))
+                data = decode(r.content)
+                failed = False
+                if etag_key is not None:
+                    store_etag(etag_key, r)
+                return True, data
+            if r.status_code == 304 and cached:
+                data = decode(cached[2])
+                failed = False
+                return True, data
+            raise_for_status(r.status_code, r.headers, r.text)
+        except RecoverableError as e:
+            failed = True
             last = str(e)
+            retry_after = e.retry_after
+        except UnrecoverableError as e:
+            return False, e
+        except ValueError as e:
+            return False, str(e)
+        finally:
+            if controller and failed is not None:
+                await controller.record(started, failed=failed)
+        if i < max_retries - 1:
+            await asyncio.sleep(backoff_delay(i, backoff, retry_after))
     return False, last
 
+def owner_lookup(keep) -> pd.Index:
+    """
+    keep -> 去重后的 object dtype owner Index，每次拉取只构建一次，供 restrict_holders 逐页复用。
+    object Index 的哈希表建好后缓存在 Index 上；string[pyarrow] Index 的 get_indexer 每次调用都会重建哈希表
+    （百万级 owner 时每页约 0.2 秒），因此 Arrow 存储的 owner 在这里转为 object。
+    """
+    index = owner_index(keep)
+    if index.dtype == object and index.is_unique:
+        # 已是 lookup（如调用方预先构建后传入）：直接复用，不再复制一份
+        return index
+    return pd.Index(index.unique(), dtype="object")
+
+def restrict_holders(holders: Holders, lookup: pd.Index) -> Holders:
+    """
+    只保留 lookup（owner_lookup 的结果）中的 owner；
+    get_indexer 复用 lookup 上已建好的哈希表，不像 isin 每次调用都重建
+    """
+    return holders[lookup.get_indexer(owner_index(holders)) >= 0]
+
+def page_collector(parts: list, keep=None, on_page: Optional[Callable] = None) -> Callable:
+    """
+    返回每页结果的收集函数，每页结果为按 owner 聚合的余额 Series，或只需地址时的 owner Index；
+    keep 非空时只保留其中的 owner（流式求交集，不必保存完整持有者列表）。
+    """
+    keep = owner_lookup(keep) if keep is not None else None
+
+    def collect(page):
+        if keep is not None:
+            page = restrict_holders(page, keep)
+        parts.append(page)
+        if on_page:
+            on_page(page)
+    return collect
+
+def page_progress(progress_cb: Optional[Callable[[int, int], None]] = None) -> Callable:
+    """
+    返回进度上报函数 advance(pages, total_est)：累计已完成页数并回调 progress_cb(pages_done, pages_total_est)，
+    总页数未知时 total_est 为 0
+    """
+    done = 0
+
+    def advance(pages: int = 1, total_est: int = 0):
+        nonlocal done
+        done += pages
+        if progress_cb:
+            progress_cb(done, total_est)
+    return advance
+
+def combine_pages(parts: list, need_balances: bool = True) -> Holders:
+    """
+    合并各页结果：余额按 owner 统一 groupby 一次（同一 owner 可能跨页出现）；
+    只需地址时合并各页 owner 并去重。
+    最终 owner 转为 Arrow 字符串存储。
+    """
+    if not need_balances:
+        chunks = [owner_array(page) for page in parts]
+        return arrow_owners(pc.unique(pa.chunked_array(chunks, type=pa.large_string())))
+    if not parts:
+        return pd.Series(dtype="float64", index=arrow_owners([]))
+    combined = pd.concat(parts).groupby(level=0, sort=False).sum()
+    combined.index = arrow_owners(combined.index)
+    return combined
+
+async def fetch_pages(fetch, consume, first_page: int, last_page: int, page_size: Union[int, Callable[[int], int]], workers: int,
+                      controller: Optional[AIMDController] = None, slow_start: bool = False):
+    """
+    workers 个 worker 依次领取页码 [first_page, last_page] 并发请求（滑动窗口），
+    fetch(page) 返回该页 items 并交给 consume；某页不足 page_size 即视为末页，之后领取的投机页直接丢弃。
+    page_size 也可以是函数 page -> 该页满载条数（各页大小不同时，如 Helius 逐步增大的批次）。
+    有 controller 时先拿到并发槽位再领取页码，在途数由 AIMDController 控制，
+    末页之后的投机请求也不会超过在途数。
+    slow_start=True 时（页数未知）类似 TCP 慢启动：没有在途页时总可以领取下一页，
+    否则在途页（按满载条数计）加上下一页不得超过已确认满载的条数，在途量每轮约翻一倍，
+    末页之后的投机请求不超过已确认的有效数据量。
+    """
+    next_page = first_page
+    stop = last_page
+    confirmed = 0
+    outstanding = 0
+    cond = asyncio.Condition()
+
+    def full_size(page: int) -> int:
+        return page_size(page) if callable(page_size) else page_size
+
+    def may_claim() -> bool:
+        if next_page > stop or not slow_start or outstanding == 0:
+            return True
+        return outstanding + full_size(next_page) <= confirmed
+
+    async def worker():
+        nonlocal next_page, stop, confirmed, outstanding
+        while next_page <= stop:
+            if controller:
+                await controller.acquire()
+            try:
+                async with cond:
+                    await cond.wait_for(may_claim)
+                    if next_page > stop:
+                        break
+                    page = next_page
+                    next_page += 1
+                    outstanding += full_size(page)
+                items = await fetch(page)
+            finally:
+                if controller:
+                    await controller.release()
+            async with cond:
+                outstanding -= full_size(page)
+                if page <= stop:
+                    consume(items)
+                    if len(items) < full_size(page):
+                        stop = min(stop, page)
+                    else:
+                        confirmed += len(items)
+                cond.notify_all()
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
 # ------------------------- Solscan Pro 实现 -------------------------
 
+@st.cache_data(ttl=DECIMALS_TTL, show_spinner=False)
 def solscan_get_decimals(mint: str, api_key: str) -> int:
     headers = {"accept": "application/json", "token": api_key}
     ok, data = retry_fetch_json(
@@ -68,6 +642,7 @@ def solscan_get_decimals(mint: str, api_key: str) -> int:
         SOLSCAN_TOKEN_META,
         headers=headers,
         params={"address": mint},
+        limiter=rate_limiter("solscan"),
     )
     if not ok:
         raise RuntimeError(f"Solscan meta失败: {data}")
@@ -77,49 +652,159 @@ def solscan_get_decimals(mint: str, api_key: str) -> int:
         dec = 9
     return int(dec)
 
-def solscan_list_holders(mint: str, api_key: str, min_amount_ui: float = 0.0, max_pages: int = 2000, page_size: int = 50) -> Dict[str, float]:
-    """返回 {owner: ui_amount}，注意：若一个owner有多个token account，Solscan返回通常已聚合为owner层级。"""
+@lru_cache(maxsize=4096)
+def _solscan_decimals(mint: str, api_key: str) -> int:
+    """
+    在 st.cache_data 之上再加一层，按 (mint, api_key) 去重 decimals 查询（decimals 铸造后不可变）。
+    作用域仅限本次脚本运行：Streamlit 每次重跑都会重新执行模块、新建 lru_cache，
+    跨重跑的复用靠 st.cache_data。
+    """
+    return solscan_get_decimals(mint, api_key)
+
+class SolscanAmount(msgspec.Struct):
+    """某些返回中 amount 嵌套为 {amount, decimals, uiAmount}"""
+    uiAmount: Optional[float] = None
+
+class SolscanHolder(msgspec.Struct):
+    # 尽量兼容字段：owner / address / tokenAccount，uiAmount / amount
+    owner: Optional[str] = None
+    address: Optional[str] = None
+    tokenAccount: Optional[str] = None
+    uiAmount: Optional[float] = None
+    amount: Union[float, SolscanAmount, None] = None
+
+    def holder(self) -> Optional[str]:
+        return self.owner or self.address or self.tokenAccount
+
+    def balance(self) -> Optional[float]:
+        # Solscan通常直接给 uiAmount
+        if self.uiAmount is not None:
+            return self.uiAmount
+        return self.amount.uiAmount if isinstance(self.amount, SolscanAmount) else self.amount
+
+class SolscanHolderPage(msgspec.Struct):
+    items: Optional[List[SolscanHolder]] = None
+    # total 不做类型约束：取值异常（如 "" / "abc"）时由 solscan_page 退回投机分页，而不是整页解码失败
+    total: Any = None
+
+class SolscanHoldersResponse(msgspec.Struct):
+    data: Union[List[SolscanHolder], SolscanHolderPage, None] = None
+    total: Any = None
+
+# strict=False：数字字符串（如 "437"）也按数字解码
+solscan_holders_decoder = msgspec.json.Decoder(SolscanHoldersResponse, strict=False)
+
+def solscan_page(data: SolscanHoldersResponse) -> Tuple[List[SolscanHolder], Optional[int]]:
+    """
+    解析一页 holders 响应，返回 (items, total)：
+    兼容 v1 {"data": [...], "total": N} 与 {"data": {"items": [...], "total": N}} 两种结构；拿不到 total 时为 None。
+    """
+    if isinstance(data.data, SolscanHolderPage):
+        items, total = data.data.items or [], data.data.total
+    else:
+        items, total = data.data or [], data.total
+    try:
+        total = int(total) if total is not None else None
+    except (TypeError, ValueError):
+        total = None
+    return items, total
+
+async def solscan_list_holders_async(mint: str, api_key: str, min_amount_ui: float = 0.0, max_pages: int = 2000, page_size: int = 50,
+                                     c_start: float = AIMD_START, c_max: int = AIMD_MAX, latency_target: float = AIMD_LATENCY_TARGET,
+                                     keep=None, on_page: Optional[Callable] = None, need_balances: bool = True,
+                                     client: Optional[httpx.AsyncClient] = None,
+                                     progress_cb: Optional[Callable[[int, int], None]] = None) -> Holders:
+    """
+    先取第一页拿到 total，再按 ceil(total/page_size) 计算总页数并发请求剩余页。
+    若返回中没有 total，则投机请求，直到某页不足 page_size 为止。
+    keep 非空时每页只保留其中的 owner；on_page 在每页聚合后回调（用于流式展示）；
+    need_balances=False 时不解析余额，只返回 owner Index；client 非空时复用该连接池；
+    progress_cb(pages_done, pages_total_est) 在每页处理后回调，总页数未知时 pages_total_est 为 0。
+    """
     headers = {"accept": "application/json", "token": api_key}
-    holders: Dict[str, float] = {}
-    offset = 0
+    limiter = rate_limiter("solscan")
+    controller = AIMDController(start=c_start, c_max=c_max, latency_target=latency_target)
+    parts: List[pd.Series] = []
+    keep_page = page_collector(parts, keep, on_page)
+    advance = page_progress(progress_cb)
 
     params = {"tokenAddress": mint, "limit": page_size}
     # fromAmount 用于缩小查询范围（单位通常为 UI 数量）
     if min_amount_ui and min_amount_ui > 0:
         params["fromAmount"] = min_amount_ui
 
-    pages = 0
-    while pages < max_pages:
-        params["offset"] = offset
-        ok, data = retry_fetch_json("GET", SOLSCAN_HOLDERS, headers=headers, params=params)
-        if not ok:
-            raise RuntimeError(f"Solscan holders失败: {data}")
-        items = (data or {}).get("data", [])
+    def consume(items: List[SolscanHolder]):
         if not items:
-            break
-        for it in items:
-            owner = it.get("owner") or it.get("address") or it.get("tokenAccount")
-            # 尽量兼容字段：uiAmount / amount
-            amt_ui = it.get("uiAmount")
-            if amt_ui is None:
-                amt_ui = it.get("amount")
-                # 如果返回的是int，需要 decimals 转换；但Solscan通常直接给 uiAmount
-                if isinstance(amt_ui, dict):
-                    # 某些返回会嵌套 {amount, decimals, uiAmount}
-                    amt_ui = amt_ui.get("uiAmount") or 0.0
-            if owner:
-                holders[owner] = float(amt_ui or 0.0)
-        if len(items) < page_size:
-            break
-        offset += page_size
-        pages += 1
-        # 简单限速
-        time.sleep(0.1)
+            return
+        owner = pd.Series([it.holder() for it in items], dtype="object")
+        if not need_balances:
+            keep_page(pd.Index(owner.dropna().unique()))
+            return
+        amt = pd.Series([it.balance() for it in items], dtype="float64")
+        page = pd.DataFrame({"owner": owner, "amt": amt.fillna(0.0)}).dropna(subset=["owner"])
+        keep_page(page.groupby("owner", sort=False)["amt"].sum())
+
+    async with client_scope(client, max(64, int(c_max))) as client:
+        async def fetch(page: int) -> SolscanHoldersResponse:
+            page_params = {**params, "offset": page * page_size}
+            # 条件请求缓存按 (mint, offset, 其余参数) 区分；api_key 不入键
+            etag_key = ("solscan", mint, page * page_size, tuple(sorted(page_params.items())))
+            ok, data = await _fetch_page(client, "GET", SOLSCAN_HOLDERS, headers=headers, params=page_params,
+                                         limiter=limiter, controller=controller, decode=solscan_holders_decoder.decode, etag_key=etag_key)
+            if not ok:
+                raise RuntimeError(f"Solscan holders失败: {data}")
+            return data
+
+        items, total = solscan_page(await fetch(0))
+        consume(items)
+        if len(items) < page_size or total is not None and total <= page_size:
+            advance(1, 1)
+            return combine_pages(parts, need_balances)
+
+        # 有 total 时总页数已知，剩余页一次性全部派发；total 恰为 page_size 整数倍时也不会多请求一页空页
+        n_pages = min(max_pages, math.ceil(total / page_size)) if total is not None else max_pages
+        total_est = n_pages if total is not None else 0
+        advance(1, total_est)
+
+        def consume_page(items: List[SolscanHolder]):
+            consume(items)
+            advance(1, total_est)
 
+        async def fetch_items(page: int) -> List[SolscanHolder]:
+            return solscan_page(await fetch(page))[0]
+
+        await fetch_pages(fetch_items, consume_page, 1, n_pages - 1, page_size, workers=int(c_max), controller=controller)
+
+    return combine_pages(parts, need_balances)
+
+@st.cache_data(ttl=HOLDERS_TTL, max_entries=64, show_spinner=False)
+def solscan_list_holders(mint: str, api_key: str, min_amount_ui: float = 0.0, max_pages: int = 2000, page_size: int = 50,
+                         need_balances: bool = True, _aimd: Optional[dict] = None) -> Holders:
+    """
+    返回 owner -> ui_amount 的 Series（need_balances=False 时为 owner Index），
+    注意：若一个owner有多个token account，Solscan返回通常已聚合为owner层级（若未聚合则按 owner 求和）。
+    _aimd 为 AIMD 调参（c_start / c_max / latency_target），下划线开头不计入 st.cache_data 的缓存键，
+    调整并发不会让缓存失效。
+    """
+    holders = load_disk_cache("solscan", mint, min_amount_ui, need_balances)
+    if holders is None:
+        holders = asyncio.run(solscan_list_holders_async(mint, api_key, min_amount_ui=min_amount_ui, max_pages=max_pages, page_size=page_size,
+                                                         need_balances=need_balances, **(_aimd or {})))
+        save_disk_cache("solscan", mint, min_amount_ui, holders)
     return holders
 
+def solscan_list_holders_in(mint: str, api_key: str, keep, min_amount_ui: float = 0.0, on_page: Optional[Callable] = None,
+                            need_balances: bool = True, **kwargs) -> Holders:
+    """只返回 keep 中的 owner（边拉取边过滤），结果依赖 keep，不做缓存"""
+    cached = load_disk_cache("solscan", mint, min_amount_ui, need_balances)
+    if cached is not None:
+        return restrict_holders(cached, owner_lookup(keep))
+    return asyncio.run(solscan_list_holders_async(mint, api_key, min_amount_ui=min_amount_ui, keep=keep, on_page=on_page,
+                                                  need_balances=need_balances, **kwargs))
+
 # ------------------------- Helius 实现 -------------------------
 
+@st.cache_data(ttl=DECIMALS_TTL, show_spinner=False)
 def helius_get_decimals(mint: str, api_key: str) -> int:
     """通过 getTokenSupply 获取 decimals"""
     url = HELIUS_GET_TOKEN_SUPPLY.format(api_key=api_key)
@@ -129,7 +814,7 @@ def helius_get_decimals(mint: str, api_key: str) -> int:
         "method": "getTokenSupply",
         "params": [mint]
     }
-    ok, data = retry_fetch_json("POST", url, headers={"Content-Type": "application/json"}, json_body=payload)
+    ok, data = retry_fetch_json("POST", url, headers={"Content-Type": "application/json"}, json_body=payload, limiter=rate_limiter("helius"))
     if not ok:
         raise RuntimeError(f"Helius getTokenSupply失败: {data}")
     val = (data or {}).get("result", {}).get("value", {})
@@ -138,63 +823,281 @@ def helius_get_decimals(mint: str, api_key: str) -> int:
         dec = 9
     return int(dec)
 
-def helius_list_holders(mint: str, api_key: str, min_amount_ui: float = 0.0, page_limit: int = 1000, max_pages: int = 10000) -> Dict[str, float]:
+@lru_cache(maxsize=4096)
+def _helius_decimals(mint: str, api_key: str) -> int:
+    """Helius 的 decimals 查询在 st.cache_data 之上的一层 lru_cache，同样只在本次脚本运行内去重（重跑时重建）"""
+    return helius_get_decimals(mint, api_key)
+
+def helius_accounts_payload(mint: str, page: int, page_limit: int) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": f"helius-getTokenAccounts-{page}",
+        "method": "getTokenAccounts",
+        "params": {
+            "mint": mint,
+            "limit": page_limit,
+            "page": page,
+            # "displayOptions": {},  # 可选
+        }
+    }
+
+class HeliusTokenAccount(msgspec.Struct):
+    owner: Optional[str] = None
+    amount: Optional[int] = 0
+
+class HeliusTokenAccounts(msgspec.Struct):
+    token_accounts: List[HeliusTokenAccount] = []
+
+class HeliusTokenAccountsResponse(msgspec.Struct):
+    """JSON-RPC 响应 {"id": ..., "result": {"token_accounts": [...]}} 或 {"error": {...}}"""
+    id: Union[str, int, None] = None
+    result: Optional[HeliusTokenAccounts] = None
+    error: Any = None
+
+# 单个响应或批量请求的响应数组；strict=False：字符串形式的 amount 也按整数解码
+helius_accounts_decoder = msgspec.json.Decoder(Union[HeliusTokenAccountsResponse, List[HeliusTokenAccountsResponse]], strict=False)
+
+def helius_accounts_items(data, page: int) -> List[HeliusTokenAccount]:
+    if not isinstance(data, HeliusTokenAccountsResponse) or data.error is not None:
+        raise RuntimeError(f"Helius getTokenAccounts失败（第 {page} 页）: {str(data)[:200]}")
+    return data.result.token_accounts if data.result else []
+
+async def helius_list_holders_async(mint: str, api_key: str, decimals: int, min_amount_ui: float = 0.0,
+                                    page_limit: int = 1000, max_pages: int = 10000,
+                                    c_start: float = AIMD_START, c_max: int = AIMD_MAX, latency_target: float = AIMD_LATENCY_TARGET,
+                                    keep=None, on_page: Optional[Callable] = None, need_balances: bool = True,
+                                    batch_pages: int = HELIUS_BATCH_PAGES, client: Optional[httpx.AsyncClient] = None,
+                                    progress_cb: Optional[Callable[[int, int], None]] = None) -> Holders:
     """
-    使用 Helius DAS getTokenAccounts（按 mint 查询 + 分页）
-    返回 {owner: ui_amount(已按多个token account汇总)}
+    页数未知：先单独请求第 1 页，不足 page_limit 即只有这一页；
+    满页才从第 2 页起投机并发请求，直到某页不足 page_limit 为止。
+    keep/on_page/need_balances/client/progress_cb
+    同 solscan_list_holders_async（页数未知，pages_total_est 始终为 0）。
+    之后每次 POST 以 JSON-RPC 批量数组请求多页：批大小从 2 页起逐批翻倍到 batch_pages，
+    在途批数按慢启动增长，末页之后的投机调用（Helius 按批内每个调用计费）不超过已确认满载的页数；
+    若服务端不支持批量（返回的不是数组，或以 4xx 拒绝），退回逐页请求。
     """
     url = HELIUS_GET_TOKEN_ACCOUNTS.format(api_key=api_key)
     headers = {"Content-Type": "application/json"}
-    decimals = helius_get_decimals(mint, api_key)
-    owners: Dict[str, float] = {}
-
-    page = 1
-    pages = 0
-    while pages < max_pages:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "helius-getTokenAccounts",
-            "method": "getTokenAccounts",
-            "params": {
-                "mint": mint,
-                "limit": page_limit,
-                "page": page,
-                # "displayOptions": {},  # 可选
-            }
-        }
-        ok, data = retry_fetch_json("POST", url, headers=headers, json_body=payload)
-        if not ok:
-            raise RuntimeError(f"Helius getTokenAccounts失败: {data}")
-        result = (data or {}).get("result", {})
-        items = result.get("token_accounts", [])
+    limiter = rate_limiter("helius")
+    controller = AIMDController(start=c_start, c_max=c_max, latency_target=latency_target)
+    parts: List[pd.Series] = []
+    keep_page = page_collector(parts, keep, on_page)
+    advance = page_progress(progress_cb)
+    scale = 1.0 / (10 ** decimals)
+    # 阈值换算为原始整数单位，低于阈值的账户直接按整数比较过滤
+    min_amount_raw = min_raw_amount(min_amount_ui, decimals)
+
+    def consume(items: List[HeliusTokenAccount]):
         if not items:
-            break
-        for acc in items:
-            owner = acc.get("owner")
-            amount_int = acc.get("amount", 0)
-            amt_ui = ui_amount(int(amount_int or 0), decimals)
-            if amt_ui < (min_amount_ui or 0.0):
-                continue
-            if owner:
-                owners[owner] = owners.get(owner, 0.0) + float(amt_ui)
-        if len(items) < page_limit:
-            break
-        page += 1
-        pages += 1
-        # 限速以防 429
-        time.sleep(0.05)
+            return
+        owner = pd.Series([acc.owner for acc in items], dtype="object")
+        if not need_balances:
+            # 只需地址：阈值为 0 时连 amount 都不看
+            if min_amount_raw > 0:
+                owner = owner[pd.Series([acc.amount or 0 for acc in items], dtype="uint64") >= min_amount_raw]
+            keep_page(pd.Index(owner.dropna().unique()))
+            return
+        raw = pd.Series([acc.amount or 0 for acc in items], dtype="uint64")
+        df = pd.DataFrame({"owner": owner, "amt": raw * scale})[(raw >= min_amount_raw) & owner.notna()]
+        keep_page(df.groupby("owner", sort=False)["amt"].sum())
+
+    def consume_batch(items: List[HeliusTokenAccount]):
+        consume(items)
+        # 一批包含多页，按实际条数折算已完成页数（末页不足 page_limit 也算一页）
+        advance(max(1, math.ceil(len(items) / page_limit)))
+
+    batching = batch_pages > 1
+
+    async with client_scope(client, max(64, int(c_max))) as client:
+        async def post(payload):
+            ok, data = await _fetch_page(client, "POST", url, headers=headers, json_body=payload, limiter=limiter, controller=controller,
+                                         decode=helius_accounts_decoder.decode)
+            if not ok:
+                if isinstance(payload, list) and isinstance(data, UnrecoverableError) and 400 <= (data.status or 0) < 500:
+                    # 服务端以 4xx（如 400/405/413）拒绝批量请求：交给 fetch_batch 退回逐页请求
+                    return None
+                raise RuntimeError(f"Helius getTokenAccounts失败: {data}")
+            return data
 
+        async def fetch_single(page: int) -> List[HeliusTokenAccount]:
+            return helius_accounts_items(await post(helius_accounts_payload(mint, page, page_limit)), page)
+
+        async def fetch_batch(batch: int) -> List[HeliusTokenAccount]:
+            """第 batch 批（从 1 开始，第 1 页已单独请求）对应的所有页，按页序拼接"""
+            nonlocal batching
+            pages = batches[batch - 1]
+            if batching:
+                data = await post([helius_accounts_payload(mint, p, page_limit) for p in pages])
+                if isinstance(data, list):
+                    by_id = {d.id: d for d in data}
+                    items: List[HeliusTokenAccount] = []
+                    for p in pages:
+                        page_items = helius_accounts_items(by_id.get(f"helius-getTokenAccounts-{p}"), p)
+                        items.extend(page_items)
+                        if len(page_items) < page_limit:
+                            break
+                    return items
+                # 不支持批量请求（返回的不是数组或被 4xx 拒绝）：本批及之后全部逐页请求
+                batching = False
+            # 逐页请求：批内顺序拉取，遇到不足 page_limit 的页即停止（并发由多个批次提供）
+            items = []
+            for p in pages:
+                page_items = await fetch_single(p)
+                items.extend(page_items)
+                if len(page_items) < page_limit:
+                    break
+            return items
+
+        # 探测：第 1 页单独请求，小 mint 只需这一次调用，不会一次性派发整批投机请求
+        items = await fetch_single(1)
+        consume_batch(items)
+        if len(items) < page_limit or max_pages <= 1:
+            return combine_pages(parts, need_balances)
+
+        # 第 2 页起分批：批大小 2、4、8…直到 batch_pages，前一批满载才会用到更大的批
+        batches: List[range] = []
+        first = 2
+        while first <= max_pages:
+            size = max(1, min(batch_pages, 2 ** (len(batches) + 1)))
+            batches.append(range(first, min(first + size, max_pages + 1)))
+            first += size
+        await fetch_pages(fetch_batch, consume_batch, 1, len(batches), lambda batch: page_limit * len(batches[batch - 1]),
+                          workers=int(c_max), controller=controller, slow_start=True)
+
+    return combine_pages(parts, need_balances)
+
+def helius_decimals_for(mint: str, api_key: str, min_amount_ui: float, need_balances: bool) -> int:
+    """只需地址且不设阈值时不需要 decimals，省掉一次 getTokenSupply"""
+    if need_balances or (min_amount_ui or 0.0) > 0:
+        return _helius_decimals(mint, api_key)
+    return 0
+
+@st.cache_data(ttl=HOLDERS_TTL, max_entries=64, show_spinner=False)
+def helius_list_holders(mint: str, api_key: str, min_amount_ui: float = 0.0, page_limit: int = 1000, max_pages: int = 10000,
+                        need_balances: bool = True, batch_pages: int = HELIUS_BATCH_PAGES, _aimd: Optional[dict] = None) -> Holders:
+    """
+    使用 Helius DAS getTokenAccounts（按 mint 查询 + 并发分页）
+    返回 owner -> ui_amount 的 Series（已按多个token account汇总）；need_balances=False 时为 owner Index；
+    _aimd 同 solscan_list_holders
+    """
+    owners = load_disk_cache("helius", mint, min_amount_ui, need_balances)
+    if owners is None:
+        decimals = helius_decimals_for(mint, api_key, min_amount_ui, need_balances)
+        owners = asyncio.run(helius_list_holders_async(mint, api_key, decimals, min_amount_ui=min_amount_ui,
+                                                       page_limit=page_limit, max_pages=max_pages,
+                                                       need_balances=need_balances, batch_pages=batch_pages, **(_aimd or {})))
+        save_disk_cache("helius", mint, min_amount_ui, owners)
     return owners
 
+def helius_list_holders_in(mint: str, api_key: str, keep, min_amount_ui: float = 0.0, on_page: Optional[Callable] = None,
+                           need_balances: bool = True, **kwargs) -> Holders:
+    """只返回 keep 中的 owner（边拉取边过滤），结果依赖 keep，不做缓存"""
+    cached = load_disk_cache("helius", mint, min_amount_ui, need_balances)
+    if cached is not None:
+        return restrict_holders(cached, owner_lookup(keep))
+    decimals = helius_decimals_for(mint, api_key, min_amount_ui, need_balances)
+    return asyncio.run(helius_list_holders_async(mint, api_key, decimals, min_amount_ui=min_amount_ui, keep=keep, on_page=on_page,
+                                                 need_balances=need_balances, **kwargs))
+
 # ------------------------- 业务逻辑 -------------------------
 
-def intersect_holders(a_map: Dict[str, float], b_map: Dict[str, float]) -> pd.DataFrame:
-    keys = set(a_map.keys()) & set(b_map.keys())
-    rows = []
-    for k in keys:
-        rows.append({"owner": k, "bal_a": a_map.get(k, 0.0), "bal_b": b_map.get(k, 0.0)})
-    df = pd.DataFrame(rows).sort_values(by=["bal_a", "bal_b"], ascending=[False, False]).reset_index(drop=True)
-    return df
+def list_holders_pair(provider: str, api_key: str, mint_a: str, mint_b: str, min_a: float = 0.0, min_b: float = 0.0, need_balances: bool = True,
+                      on_page_a: Optional[Callable] = None, on_page_b: Optional[Callable] = None,
+                      progress_a: Optional[Callable[[int, int], None]] = None, progress_b: Optional[Callable[[int, int], None]] = None,
+                      **kwargs) -> Tuple[Holders, Holders]:
+    """
+    A、B 两个 mint 并发拉取（asyncio.gather），共用一个 httpx.AsyncClient 连接池；
+    内存缓存或磁盘快照命中的一侧不再请求，拉取结果写入两者。provider 为 "helius" / "solscan"。
+    on_page_*、progress_* 分别为两侧的每页结果回调与进度回调 (pages_done, pages_total_est)。
+    """
+    sides = [(mint_a, min_a, on_page_a, progress_a), (mint_b, min_b, on_page_b, progress_b)]
+    results = [cached_holders(provider, mint, min_amount_ui, need_balances) for mint, min_amount_ui, _, _ in sides]
+    missing = [i for i, holders in enumerate(results) if holders is None]
+    if not missing:
+        return results[0], results[1]
+
+    # decimals 是同步请求（且有缓存），在进入事件循环前取好
+    decimals = {i: helius_decimals_for(sides[i][0], api_key, sides[i][1], need_balances) for i in missing} if provider == "helius" else {}
+
+    async def fetch_missing() -> List[Holders]:
+        async with http_client(max(64, 2 * int(kwargs.get("c_max", AIMD_MAX)))) as client:
+            jobs = []
+            for i in missing:
+                mint, min_amount_ui, on_page, progress_cb = sides[i]
+                opts = dict(min_amount_ui=min_amount_ui, on_page=on_page, progress_cb=progress_cb, need_balances=need_balances,
+                            client=client, **kwargs)
+                if provider == "helius":
+                    jobs.append(helius_list_holders_async(mint, api_key, decimals[i], **opts))
+                else:
+                    jobs.append(solscan_list_holders_async(mint, api_key, **opts))
+            return await asyncio.gather(*jobs)
+
+    for i, holders in zip(missing, asyncio.run(fetch_missing())):
+        results[i] = holders
+        memo_holders(provider, sides[i][0], sides[i][1], need_balances, _holders=holders)
+        save_disk_cache(provider, sides[i][0], sides[i][1], holders)
+    return results[0], results[1]
+
+def intersect_holders(a_map: Holders, b_map: Holders) -> pd.DataFrame:
+    """在 Arrow 字符串数组上用 pyarrow.compute 求交集（向量化哈希查找），最后一步才转为 pandas 供展示"""
+    a_owners, b_owners = owner_array(a_map), owner_array(b_map)
+    if isinstance(a_map, pd.Index) or isinstance(b_map, pd.Index):
+        # 只需地址：不带余额列
+        wallets = pc.filter(a_owners, pc.is_in(a_owners, value_set=b_owners))
+        return pd.DataFrame({"wallet": arrow_owners(wallets)}).sort_values("wallet", ignore_index=True)
+    # index_in 给出 A 中每个 owner 在 B 中的位置（不在 B 中为 null）
+    pos = pc.index_in(a_owners, value_set=b_owners)
+    mask = pc.is_valid(pos)
+    df = pd.DataFrame({
+        "owner": arrow_owners(pc.filter(a_owners, mask)),
+        "bal_a": a_map.to_numpy(dtype="float64")[mask.to_numpy(zero_copy_only=False)],
+        "bal_b": b_map.to_numpy(dtype="float64")[pc.filter(pos, mask).to_numpy()],
+    })
+    return df.sort_values(by=["bal_a", "bal_b"], ascending=[False, False], ignore_index=True)
+
+class IntersectionPreview:
+    """
+    低内存模式下的交集预览：A 的每页结果已只含同时持有 B 的 owner，
+    逐页并入累计结果（同一 owner 跨页出现时余额累加），已合并的页不再重复处理。
+    预览只取前 top 行：余额只增不减，新的前 top 只可能来自上次的前 top 与之后新出现/更新的 owner。
+    b_lookup 为 owner_lookup(b_map)，与 b_map 的 owner 顺序一致（b_map 已按 owner 聚合），查 B 余额时不重建哈希表。
+    """
+
+    def __init__(self, b_map: Holders, b_lookup: pd.Index, top: int = 1000):
+        self.b_bal = b_map.to_numpy(dtype="float64") if isinstance(b_map, pd.Series) else None
+        self.b_lookup = b_lookup
+        self.top = top
+        self.bal_a: Dict[str, float] = {}
+        self.leaders: List[str] = []
+        self.touched = set()
+
+    def __len__(self) -> int:
+        """已发现的交集地址数（按 owner 去重）"""
+        return len(self.bal_a)
+
+    def add(self, page: Holders):
+        if isinstance(page, pd.Series):
+            for owner, amt in zip(page.index, page.to_numpy(dtype="float64")):
+                self.bal_a[owner] = self.bal_a.get(owner, 0.0) + amt
+        else:
+            for owner in page:
+                self.bal_a.setdefault(owner, 0.0)
+        self.touched.update(owner_index(page))
+
+    def frame(self) -> pd.DataFrame:
+        candidates = self.touched.union(self.leaders)
+        self.touched = set()
+        if self.b_bal is None:
+            self.leaders = heapq.nsmallest(self.top, candidates)
+            return pd.DataFrame({"wallet": self.leaders})
+        self.leaders = heapq.nlargest(self.top, candidates, key=self.bal_a.__getitem__)
+        df = pd.DataFrame({
+            "owner": self.leaders,
+            "bal_a": [self.bal_a[owner] for owner in self.leaders],
+            "bal_b": self.b_bal[self.b_lookup.get_indexer(self.leaders)],
+        })
+        return df.sort_values(by=["bal_a", "bal_b"], ascending=[False, False], ignore_index=True)
 
 # ------------------------- Streamlit UI -------------------------
 
@@ -222,6 +1125,28 @@ with col1:
 with col2:
     min_a = st.number_input("代币A 最低持仓（UI）", min_value=0.0, value=100.0, step=1.0)
     min_b = st.number_input("代币B 最低持仓（UI）", min_value=0.0, value=100.0, step=1.0)
+    include_balances = st.checkbox("结果包含持仓余额", value=True,
+                                   help="不勾选时只返回同时持有的钱包地址，不解析余额"
+                                        "（阈值为 0 时也不查询 decimals）")
+    low_memory = st.checkbox("低内存模式", value=False,
+                             help="先拉取 B，再边拉取 A 边求交集，A 的完整持有者列表不驻留内存；"
+                                  "默认 A、B 并发拉取，速度约快一倍")
+
+with st.sidebar:
+    st.subheader("并发控制（AIMD）")
+    aimd_start = st.number_input("初始并发数", min_value=1, max_value=64, value=AIMD_START, step=1)
+    aimd_max = st.number_input("最大并发数", min_value=1, max_value=128, value=AIMD_MAX, step=1)
+    aimd_latency = st.number_input("目标平均延迟（秒）", min_value=0.1, max_value=30.0, value=AIMD_LATENCY_TARGET, step=0.1)
+    aimd_opts = {"c_start": min(aimd_start, aimd_max), "c_max": aimd_max, "latency_target": aimd_latency}
+
+    st.subheader("缓存")
+    st.caption(f"decimals 缓存 1 天，持有者列表缓存 {HOLDERS_TTL // 60} 分钟（磁盘：{CACHE_DIR}）")
+    if st.button("清除缓存"):
+        st.cache_data.clear()
+        clear_disk_cache()
+        with etag_lock():
+            etag_cache().clear()
+        st.success("缓存已清除")
 
 run = st.button("开始查询")
 
@@ -231,37 +1156,89 @@ if run:
         st.stop()
 
     if "Helius" in provider:
+        source, provider_key = "Helius", "helius"
         api_key = get_secret("HELIUS_API_KEY")
         if not api_key:
             st.error("未检测到 HELIUS_API_KEY，请在 .streamlit/secrets.toml 配置")
             st.stop()
-        with st.spinner("Helius 正在拉取代币A持有者..."):
-            a_map = helius_list_holders(mint_a.strip(), api_key, min_amount_ui=min_a)
-        with st.spinner("Helius 正在拉取代币B持有者..."):
-            b_map = helius_list_holders(mint_b.strip(), api_key, min_amount_ui=min_b)
+        list_holders, list_holders_in = helius_list_holders, helius_list_holders_in
 
     else:
+        source, provider_key = "Solscan", "solscan"
         api_key = get_secret("SOLSCAN_API_KEY")
         if not api_key:
             st.error("未检测到 SOLSCAN_API_KEY，请在 .streamlit/secrets.toml 配置")
             st.stop()
-        # 虽然 Solscan 多半已是 UI 数量，这里还是获取 decimals 备用（也可展示）
-        with st.spinner("Solscan 正在读取代币元数据..."):
-            try:
-                dec_a = solscan_get_decimals(mint_a.strip(), api_key)
-                dec_b = solscan_get_decimals(mint_b.strip(), api_key)
-                st.caption(f"Decimals: A={dec_a}, B={dec_b}")
-            except Exception as e:
-                st.warning(f"读取 decimals 失败（继续）：{e}")
+        # 虽然 Solscan 多半已是 UI 数量，这里还是获取 decimals 备用（也可展示）；只需地址时跳过
+        if include_balances:
+            with st.spinner("Solscan 正在读取代币元数据..."):
+                try:
+                    dec_a = _solscan_decimals(mint_a.strip(), api_key)
+                    dec_b = _solscan_decimals(mint_b.strip(), api_key)
+                    st.caption(f"Decimals: A={dec_a}, B={dec_b}")
+                except Exception as e:
+                    st.warning(f"读取 decimals 失败（继续）：{e}")
+        list_holders, list_holders_in = solscan_list_holders, solscan_list_holders_in
+
+    status = st.status(f"{source} 正在拉取持有者...", expanded=True)
+    with status:
+        metrics = st.empty()
+        preview = st.empty()
+    counts = {"A": 0, "B": 0}
+    progress = {"A": "", "B": ""}
+    PREVIEW_EVERY = 5  # 低内存模式下每 K 页（按 progress_cb 的页数）刷新一次交集预览
+    hits: Optional[IntersectionPreview] = None
+    previewed = {"pages": 0}
 
-        with st.spinner("Solscan 正在拉取代币A持有者..."):
-            a_map = solscan_list_holders(mint_a.strip(), api_key, min_amount_ui=min_a)
-        with st.spinner("Solscan 正在拉取代币B持有者..."):
-            b_map = solscan_list_holders(mint_b.strip(), api_key, min_amount_ui=min_b)
+    def show_progress():
+        sides = [f"{side} {progress[side]}" for side in ("A", "B") if progress[side]]
+        status.update(label=f"{source} 正在拉取持有者：" + "，".join(sides))
+
+    def counter(side: str):
+        def on_page(page):
+            if low_memory:
+                hits.add(page)
+                metrics.metric("交集地址（已发现）", len(hits))
+            else:
+                # 同一 owner 的多个 token account 可能分布在不同页，这里只是近似值
+                counts[side] += len(page)
+                metrics.metric("已拉取地址（A / B，约）", f"{counts['A']} / {counts['B']}")
+        return on_page
+
+    def pages(side: str):
+        def progress_cb(done: int, total: int):
+            progress[side] = f"{done}/{total} 页" if total else f"{done} 页"
+            show_progress()
+            if low_memory and done - previewed["pages"] >= PREVIEW_EVERY:
+                previewed["pages"] = done
+                preview.dataframe(hits.frame(), use_container_width=True)
+        return progress_cb
+
+    if low_memory:
+        # 先拉取 B，再拉取 A 时逐页只保留同时持有 B 的地址，A 的完整持有者列表不会驻留内存
+        status.update(label=f"{source} 正在拉取代币B持有者...")
+        b_map = list_holders(mint_b.strip(), api_key, min_amount_ui=min_b, need_balances=include_balances, _aimd=aimd_opts)
+        # B 的 owner 查找表只构建一次：逐页过滤与预览共用
+        b_lookup = owner_lookup(b_map)
+        hits = IntersectionPreview(b_map, b_lookup)
+        status.update(label=f"{source} 正在拉取代币A持有者（仅保留同时持有B的地址）...")
+        a_map = list_holders_in(mint_a.strip(), api_key, b_lookup, min_amount_ui=min_a, on_page=counter("A"), progress_cb=pages("A"),
+                                need_balances=include_balances, **aimd_opts)
+        summary = f"完成：B 持有人数={len(b_map)}，A 中同时持有 B 的地址数={len(a_map)}"
+    else:
+        a_map, b_map = list_holders_pair(provider_key, api_key, mint_a.strip(), mint_b.strip(), min_a, min_b,
+                                         need_balances=include_balances, on_page_a=counter("A"), on_page_b=counter("B"),
+                                         progress_a=pages("A"), progress_b=pages("B"), **aimd_opts)
+        summary = f"完成：A 持有人数={len(a_map)}, B 持有人数={len(b_map)}"
+    preview.empty()
+    status.update(label=summary, state="complete", expanded=False)
 
-    st.success(f"完成：A 持有人数={len(a_map)}, B 持有人数={len(b_map)}")
+    st.session_state["intersection_df"] = intersect_holders(a_map, b_map)
+    st.session_state["intersection_summary"] = summary
 
-    df = intersect_holders(a_map, b_map)
+if "intersection_df" in st.session_state:
+    df = st.session_state["intersection_df"]
+    st.success(st.session_state["intersection_summary"])
     st.subheader(f"交集地址数：{len(df)}")
     st.dataframe(df, use_container_width=True)
 